@@ -0,0 +1,101 @@
+from asgiref.sync import sync_to_async
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse
+from django.views import View
+from django_filters.utils import translate_validation
+from rest_framework.authtoken.models import Token
+
+from .fast_serializers import aproduct_rows
+from .filters import ProductFilter
+from .models import Product, Order
+from .renderers import FastJSONRenderer
+from .serializers import OrderSerializer
+
+ORDER_PREFETCH = ['ordered_items__product__category__shops', 'contact']
+
+
+def _json(data, status=200):
+    # Тот же рендерер, что и у синхронных эндпоинтов каталога
+    return HttpResponse(FastJSONRenderer().render(data), status=status,
+                        content_type='application/json')
+
+
+def _not_authenticated():
+    response = _json({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+def _serialize(serializer_class, instance, many=False, prefetch=()):
+    """Сериализация уже загруженных объектов (выполняется в потоке)"""
+    if prefetch:
+        prefetch_related_objects(instance if many else [instance], *prefetch)
+    return serializer_class(instance, many=many).data
+
+
+aserialize = sync_to_async(_serialize)
+
+
+async def aget_token_user(request):
+    """Асинхронный аналог TokenAuthentication"""
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=auth[1])
+    except Token.DoesNotExist:
+        return None
+    if not token.user.is_active:
+        return None
+    return token.user
+
+
+class AsyncProductListView(View):
+    """Список товаров с фильтрацией (ASGI)"""
+
+    async def get(self, request):
+        # Тот же FilterSet, что и у ProductListView; проверка category
+        # обращается к базе, поэтому выполняется в потоке
+        filterset = ProductFilter(request.GET, queryset=Product.objects.live())
+        if not await sync_to_async(filterset.is_valid)():
+            return _json(translate_validation(filterset.errors).detail, status=400)
+
+        return _json(await aproduct_rows(filterset.qs))
+
+
+class AsyncProductDetailView(View):
+    """Детальная информация о товаре (ASGI)"""
+
+    async def get(self, request, pk):
+        rows = await aproduct_rows(Product.objects.live().filter(pk=pk))
+        if not rows:
+            return _json({'detail': 'Не найдено.'}, status=404)
+        return _json(rows[0])
+
+
+class AsyncCartView(View):
+    """Просмотр корзины (ASGI)"""
+
+    async def get(self, request):
+        user = await aget_token_user(request)
+        if user is None:
+            return _not_authenticated()
+
+        order, _ = await Order.objects.aget_or_create(user=user, state='basket')
+        data = await aserialize(OrderSerializer, order, prefetch=ORDER_PREFETCH)
+        return _json(data)
+
+
+class AsyncOrderListView(View):
+    """Список заказов пользователя (ASGI)"""
+
+    async def get(self, request):
+        user = await aget_token_user(request)
+        if user is None:
+            return _not_authenticated()
+
+        queryset = Order.objects.filter(user=user).exclude(state='basket')
+        orders = [order async for order in queryset]
+        data = await aserialize(OrderSerializer, orders, many=True,
+                                prefetch=ORDER_PREFETCH)
+        return _json(data)
@@ -0,0 +1,409 @@
+import csv
+import io
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .facets import refresh_facets, refresh_product_facets_on_commit
+from .models import CatalogVersion, Category, Order, OrderItem, Product
+from .stock import get_stock_counters, reservations_enabled
+
+# Поля Product, загружаемые из прайса, в порядке колонок COPY
+STAGED_FIELDS = ['name', 'ID_product', 'info', 'quantity', 'price', 'price_rrc',
+                 'model', 'reserved', 'category', 'user', 'version']
+
+COPY_NULL = '\\N'
+MAX_ERRORS = 20
+CLEANUP_BATCH_SIZE = 1000
+# Через сколько неопубликованная версия считается брошенной
+# (импорт прервался между загрузкой и публикацией)
+STAGING_TTL = timedelta(hours=1)
+
+# Поля, которые можно менять без повторного импорта прайса
+STOCK_FIELDS = ['quantity', 'price', 'price_rrc']
+
+
+def validate_goods(goods):
+    """Проверка товаров прайса до загрузки. Возвращает список строк для Product"""
+    errors = []
+    rows = []
+    seen = set()
+
+    try:
+        category_ids = {item['category'] for item in goods}
+    except (KeyError, TypeError):
+        raise ValidationError('У каждого товара должна быть указана категория')
+    known_categories = set(
+        Category.objects.filter(id__in=category_ids).values_list('id', flat=True)
+    )
+
+    for number, item in enumerate(goods, 1):
+        try:
+            row = {
+                'name': str(item['name']),
+                'ID_product': int(item['id']),
+                'info': str(item.get('parameters', '')),
+                'quantity': int(item['quantity']),
+                'price': int(item['price']),
+                'price_rrc': int(item['price_rrc']) if item.get('price_rrc') is not None else None,
+                'model': str(item.get('model', '')),
+                'category': item['category'],
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f'Товар №{number}: некорректное поле {e}')
+            continue
+
+        if len(row['name']) > Product._meta.get_field('name').max_length:
+            errors.append(f'Товар №{number}: слишком длинное название')
+        if len(row['info']) > Product._meta.get_field('info').max_length:
+            errors.append(f'Товар №{number}: слишком длинная информация')
+        if len(row['model']) > Product._meta.get_field('model').max_length:
+            errors.append(f'Товар №{number}: слишком длинная модель')
+        if min(row['ID_product'], row['quantity'], row['price'], row['price_rrc'] or 0) < 0:
+            errors.append(f'Товар №{number}: отрицательные значения недопустимы')
+        if row['category'] not in known_categories:
+            errors.append(f'Товар №{number}: неизвестная категория {row["category"]}')
+        if row['ID_product'] in seen:
+            errors.append(f'Товар №{number}: повторяющийся id {row["ID_product"]}')
+        seen.add(row['ID_product'])
+        rows.append(row)
+
+        if len(errors) >= MAX_ERRORS:
+            break
+
+    if errors:
+        raise ValidationError(errors)
+    return rows
+
+
+def stage_catalog(user, goods):
+    """Загрузка прайса в новую (неопубликованную) версию каталога магазина"""
+    rows = validate_goods(goods)
+
+    with transaction.atomic():
+        version = CatalogVersion.objects.create(user=user)
+        for row in rows:
+            row.update(reserved=0, user=user.pk, version=version.pk)
+
+        if connection.vendor == 'postgresql':
+            _copy_products(rows)
+        else:
+            Product.objects.bulk_create([
+                Product(**{
+                    Product._meta.get_field(field).attname: row[field]
+                    for field in STAGED_FIELDS
+                })
+                for row in rows
+            ], batch_size=1000)
+
+        staged = version.products.count()
+        if staged != len(rows):
+            raise ValidationError(f'Загружено {staged} товаров из {len(rows)}')
+
+    return version
+
+
+def _copy_products(rows):
+    """Загрузка строк в таблицу товаров через COPY FROM STDIN"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([COPY_NULL if row[field] is None else row[field] for field in STAGED_FIELDS])
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Product._meta.get_field(field).column) for field in STAGED_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {quote(Product._meta.db_table)} ({columns}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer,
+        )
+
+
+def publish_catalog(version):
+    """Атомарная публикация версии: текущая становится предыдущей (для отката).
+
+    Если публикация не удалась, загруженная версия удаляется.
+    """
+    try:
+        with transaction.atomic():
+            versions = _lock_versions(version.user_id)
+            _move_baskets(version.user_id, version.pk)
+            versions.filter(state='previous').update(state='archived')
+            versions.filter(state='live').update(state='previous')
+
+            # Товары, загруженные до версионирования, тоже сохраняем для отката
+            legacy = Product.objects.filter(user_id=version.user_id, version__isnull=True)
+            if legacy.exists():
+                legacy.update(version=CatalogVersion.objects.create(
+                    user_id=version.user_id, state='previous', published_at=timezone.now()
+                ))
+
+            versions.filter(pk=version.pk).update(state='live', published_at=timezone.now())
+            refresh_facets(version.user_id)
+    except Exception:
+        # Повторный импорт загрузит прайс заново, копия каталога не нужна
+        staged = CatalogVersion.objects.filter(pk=version.pk, state='staging')
+        if staged.exists():
+            _delete_products(Product.objects.filter(version__in=staged))
+            staged.delete()
+        raise
+
+    cleanup_catalog(version.user_id)
+
+
+def rollback_catalog(user_id):
+    """Возврат предыдущей версии каталога. Возвращает ее или None"""
+    with transaction.atomic():
+        versions = _lock_versions(user_id)
+        previous = versions.filter(state='previous').order_by('-published_at').first()
+        if previous is None:
+            return None
+
+        _move_baskets(user_id, previous.pk)
+        versions.filter(state='live').update(state='archived')
+        versions.filter(pk=previous.pk).update(state='live')
+        refresh_facets(user_id)
+
+    cleanup_catalog(user_id)
+    return previous
+
+
+def _move_baskets(user_id, version_id):
+    """Перенос позиций корзин с опубликованных товаров на товары версии
+    version_id с тем же ID_product. Резерв товаров обеих версий
+    пересчитывается по корзинам.
+
+    Выполняется в транзакции переключения до смены состояний версий.
+    Позиции товаров, которых нет в новой версии, остаются на старых
+    товарах: подтвердить такой заказ нельзя, удалить из корзины - можно.
+    """
+    source = Product.objects.live().filter(user_id=user_id).exclude(version_id=version_id)
+    target = Product.objects.filter(version_id=version_id)
+    source_ids = dict(source.values_list('pk', 'ID_product'))
+    target_ids = dict(target.values_list('ID_product', 'pk'))
+
+    # Корзины блокируются так же, как в CartView и OrderConfirmView
+    orders = list(
+        Order.objects.select_for_update()
+        .filter(state='basket', pk__in=OrderItem.objects.filter(
+            product__in=source.values('pk')
+        ).values('order_id'))
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    items = []
+    for item in OrderItem.objects.filter(order_id__in=orders, product__in=source.values('pk')):
+        product_id = target_ids.get(source_ids[item.product_id])
+        if product_id is not None:
+            item.product_id = product_id
+            items.append(item)
+    OrderItem.objects.bulk_update(items, ['product'], batch_size=1000)
+
+    in_baskets = (
+        OrderItem.objects.filter(product=OuterRef('pk'), order__state='basket')
+        .order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    )
+    Product.objects.filter(Q(pk__in=source.values('pk')) | Q(version_id=version_id)).update(
+        reserved=Coalesce(Subquery(in_baskets), Value(0))
+    )
+
+    if reservations_enabled():
+        # Счетчики Redis обеих версий заново прочитают резерв из базы
+        product_ids = [*source_ids, *target_ids.values()]
+        transaction.on_commit(lambda: get_stock_counters().forget(product_ids))
+
+
+def cleanup_catalog(user_id):
+    """Удаление архивных и брошенных неопубликованных версий каталога
+    вне транзакции переключения.
+
+    Товары, на которые ссылаются заказы, сохраняются вместе со своей версией.
+    """
+    stale = CatalogVersion.objects.filter(user_id=user_id).filter(
+        Q(state='archived') | Q(state='staging', created_at__lt=timezone.now() - STAGING_TTL)
+    )
+    _delete_products(Product.objects.filter(version__in=stale))
+    stale.filter(products__isnull=True).delete()
+
+
+def _delete_products(products):
+    """Удаление товаров без заказов пачками (со счетчиками Redis)"""
+    product_ids = list(products.filter(ordered_items__isnull=True).values_list('id', flat=True))
+    for start in range(0, len(product_ids), CLEANUP_BATCH_SIZE):
+        batch = product_ids[start:start + CLEANUP_BATCH_SIZE]
+        Product.objects.filter(pk__in=batch, ordered_items__isnull=True).delete()
+        if reservations_enabled():
+            get_stock_counters().forget(batch)
+
+
+def _lock_versions(user_id):
+    # Блокируем версии магазина, чтобы публикации не выполнялись параллельно
+    versions = CatalogVersion.objects.filter(user_id=user_id)
+    list(versions.select_for_update().values_list('pk', flat=True))
+    return versions
+
+
+def patch_stock(user_id, items):
+    """Обновление остатков и цен опубликованного каталога магазина одним UPDATE.
+
+    Количество не может стать меньше зарезервированного. Возвращает число
+    обновленных товаров и ошибки по отдельным позициям.
+    """
+    errors = []
+    values = {}
+    for item in items:
+        id_product = item.get('ID_product') if isinstance(item, dict) else None
+        try:
+            id_product = int(id_product)
+            row = [None if item.get(field) is None else int(item[field]) for field in STOCK_FIELDS]
+        except (TypeError, ValueError):
+            errors.append({'ID_product': id_product, 'Error': 'Некорректные данные'})
+            continue
+
+        if all(value is None for value in row):
+            errors.append({'ID_product': id_product, 'Error': 'Не указаны изменяемые поля'})
+        elif any(value is not None and value < 0 for value in row):
+            errors.append({'ID_product': id_product, 'Error': 'Отрицательные значения недопустимы'})
+        elif id_product in values:
+            errors.append({'ID_product': id_product, 'Error': 'Повторяющийся ID_product'})
+        else:
+            values[id_product] = row
+
+    if not values:
+        return {'Updated': 0, 'Errors': errors}
+
+    counters = get_stock_counters() if reservations_enabled() else None
+    decreased = []
+    committed = False
+
+    def mark_committed():
+        nonlocal committed
+        committed = True
+
+    try:
+        with transaction.atomic():
+            # Регистрируется первым: выполняется раньше остальных on_commit
+            transaction.on_commit(mark_committed)
+            if counters is not None:
+                # Product.reserved в базе отстает от резервов в Redis,
+                # поэтому остаток проверяется и меняется по счетчикам
+                increased = _change_counters(user_id, values, counters, decreased, errors)
+                # Рост остатка доступен покупателям только после фиксации
+                transaction.on_commit(
+                    lambda: _add_available(counters, increased), robust=True
+                )
+            updated = _update_stock(user_id, values, check_reserved=counters is None) if values else []
+
+            missing = set(values) - {id_product for _, id_product, _ in updated}
+            reserved = dict(
+                Product.objects.live()
+                .filter(user_id=user_id, ID_product__in=missing)
+                .values_list('ID_product', 'reserved')
+            )
+            for id_product in sorted(missing):
+                if id_product in reserved:
+                    errors.append({'ID_product': id_product,
+                                   'Error': f'Количество меньше зарезервированного ({reserved[id_product]})'})
+                else:
+                    errors.append({'ID_product': id_product, 'Error': 'Товар не найден'})
+
+            # Агрегаты пересчитываются после фиксации, не удерживая блокировки товаров
+            refresh_product_facets_on_commit(
+                (user_id, category_id) for _, _, category_id in updated
+            )
+    except Exception:
+        # После фиксации уменьшение остатка уже верно, отменять нечего
+        if not committed:
+            _add_available(counters, [(product_id, -delta) for product_id, delta in decreased])
+        raise
+
+    return {'Updated': len(updated), 'Errors': errors}
+
+
+def _change_counters(user_id, values, counters, decreased, errors):
+    """Перенос изменений quantity в счетчики Redis под блокировкой строк товаров.
+
+    Уменьшение применяется сразу (с проверкой резерва) и добавляется
+    в decreased для отката; позиции, у которых количество стало бы меньше
+    зарезервированного, убираются из values с ошибкой. Увеличения
+    возвращаются для применения после фиксации.
+    """
+    increased = []
+    rows = (
+        Product.objects.live()
+        .select_for_update(of=('self',))
+        .filter(user_id=user_id, ID_product__in=[
+            id_product for id_product, row in values.items() if row[0] is not None
+        ])
+        .order_by('pk')
+        .values_list('pk', 'ID_product', 'quantity')
+    )
+    for product_id, id_product, quantity in rows:
+        delta = values[id_product][0] - quantity
+        if delta > 0:
+            # Счетчик создается сейчас, пока в базе старое количество,
+            # чтобы после фиксации увеличение не учлось дважды
+            counters.change(product_id, 0)
+            increased.append((product_id, delta))
+        elif delta < 0:
+            ok, available = counters.change(product_id, delta)
+            if ok:
+                decreased.append((product_id, delta))
+            else:
+                errors.append({'ID_product': id_product,
+                               'Error': f'Количество меньше зарезервированного ({quantity - available})'})
+                del values[id_product]
+    return increased
+
+
+def _add_available(counters, deltas):
+    for product_id, delta in deltas:
+        counters.add_available(product_id, delta)
+
+
+def _update_stock(user_id, values, check_reserved=True):
+    """UPDATE ... FROM (VALUES ...) по товарам опубликованной версии.
+    Возвращает (id, ID_product, category_id) обновленных товаров"""
+    quote = connection.ops.quote_name
+
+    def column(name):
+        return quote(Product._meta.get_field(name).column)
+
+    rows = ', '.join(
+        ['(%s, CAST(%s AS integer), CAST(%s AS integer), CAST(%s AS integer))'] * len(values)
+    )
+    params = [param for id_product, row in values.items() for param in (id_product, *row)]
+    reserved_check = (
+        f"AND (v.new_quantity IS NULL OR v.new_quantity >= p.{column('reserved')})" if check_reserved else ''
+    )
+
+    # Колонки VALUES называются column1..N и в PostgreSQL, и в SQLite.
+    # SQLite не допускает имен с таблицей в RETURNING, поэтому имена колонок
+    # v не должны совпадать с колонками товара
+    sql = f"""
+        UPDATE {quote(Product._meta.db_table)} AS p SET
+            {column('quantity')} = COALESCE(v.new_quantity, p.{column('quantity')}),
+            {column('price')} = COALESCE(v.new_price, p.{column('price')}),
+            {column('price_rrc')} = COALESCE(v.new_price_rrc, p.{column('price_rrc')})
+        FROM (
+            SELECT column1 AS item_id, column2 AS new_quantity, column3 AS new_price, column4 AS new_price_rrc
+            FROM (VALUES {rows}) AS v0
+        ) AS v
+        WHERE p.{column('user')} = %s
+          AND p.{column('ID_product')} = v.item_id
+          AND (p.{column('version')} IS NULL OR p.{column('version')} IN (
+              SELECT id FROM {quote(CatalogVersion._meta.db_table)}
+              WHERE {quote(CatalogVersion._meta.get_field('user').column)} = %s AND state = 'live'
+          ))
+          {reserved_check}
+        RETURNING id, {column('ID_product')}, {column('category')}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [user_id, user_id])
+        return cursor.fetchall()
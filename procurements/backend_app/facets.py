@@ -0,0 +1,106 @@
+import logging
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .models import Product, ProductFacet
+
+FACET_FIELDS = ['product_count', 'in_stock_count', 'min_price', 'max_price']
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_facets(user_id, category_ids=None):
+    """Пересчет агрегатов магазина по всем или только по указанным категориям.
+
+    Группировка идет только по товарам одного магазина, а не по всему каталогу.
+    Читаем из основной базы: результат записывается туда же.
+    """
+    products = Product.objects.db_manager(DEFAULT_DB_ALIAS).live().filter(user_id=user_id)
+    facets = ProductFacet.objects.filter(user_id=user_id)
+    if category_ids is not None:
+        products = products.filter(category_id__in=category_ids)
+        facets = facets.filter(category_id__in=category_ids)
+
+    # Строки агрегатов блокируются в порядке category_id
+    rows = products.order_by('category_id').values('category_id').annotate(
+        product_count=Count('id'),
+        in_stock_count=Count('id', filter=Q(quantity__gt=0)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    )
+    objects = [ProductFacet(user_id=user_id, **row) for row in rows]
+
+    with transaction.atomic():
+        ProductFacet.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['user', 'category'],
+            update_fields=FACET_FIELDS,
+        )
+        facets.exclude(category_id__in=[obj.category_id for obj in objects]).delete()
+
+
+def refresh_product_facets(pairs):
+    """Пересчет агрегатов по парам (user_id, category_id) измененных товаров.
+
+    Пары обрабатываются по порядку, чтобы параллельные пересчеты
+    не блокировали строки ProductFacet крест-накрест.
+    """
+    categories = defaultdict(set)
+    for user_id, category_id in pairs:
+        categories[user_id].add(category_id)
+    for user_id, category_ids in sorted(categories.items()):
+        refresh_facets(user_id, sorted(category_ids))
+
+
+def refresh_product_facets_on_commit(pairs):
+    """Пересчет агрегатов по парам (user_id, category_id) после фиксации.
+
+    Ошибка пересчета не отменяет уже зафиксированную операцию и не попадает
+    в ответ: агрегаты поправит следующий пересчет или команда rebuild_facets.
+    """
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+
+    def refresh():
+        try:
+            refresh_product_facets(pairs)
+        except Exception:
+            logger.exception('Не удалось пересчитать фасеты %s', pairs)
+
+    transaction.on_commit(refresh)
+
+
+def get_facets(filters=None):
+    """Фасеты каталога с учетом фильтров списка товаров.
+
+    Фильтры ProductListView (category, user__shop__name) применимы
+    к ProductFacet без изменений.
+    """
+    facets = ProductFacet.objects.filter(**(filters or {}))
+    totals = {'count': Sum('product_count'), 'in_stock': Sum('in_stock_count')}
+
+    categories = facets.order_by('category__name').values(
+        'category_id', 'category__name'
+    ).annotate(**totals)
+    shops = facets.order_by('user__shop__name').values(
+        'user__shop__id', 'user__shop__name'
+    ).annotate(**totals)
+    price = facets.aggregate(min=Min('min_price'), max=Max('max_price'))
+
+    return {
+        'categories': [
+            {'id': row['category_id'], 'name': row['category__name'],
+             'count': row['count'], 'in_stock': row['in_stock']}
+            for row in categories
+        ],
+        'shops': [
+            {'id': row['user__shop__id'], 'name': row['user__shop__name'],
+             'count': row['count'], 'in_stock': row['in_stock']}
+            for row in shops
+        ],
+        'price': price,
+    }
@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from .models import Category
+
+# Ключи ответа ProductSerializer и соответствующие колонки values_list.
+# Поле shop у Product отсутствует, и ProductSerializer его пропускает.
+PRODUCT_FIELDS = (
+    ('id', 'id'),
+    ('ID_product', 'ID_product'),
+    ('name', 'name'),
+    ('info', 'info'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+    ('category', 'category_id'),
+    ('user', 'user_id'),
+)
+PRODUCT_KEYS = tuple(key for key, _ in PRODUCT_FIELDS)
+PRODUCT_COLUMNS = tuple(column for _, column in PRODUCT_FIELDS)
+CATEGORY_INDEX = PRODUCT_COLUMNS.index('category_id')
+
+CategoryShop = Category.shops.through
+
+
+def product_values(queryset):
+    return queryset.values_list(*PRODUCT_COLUMNS)
+
+
+def _category_queries(category_ids):
+    return (
+        Category.objects.filter(id__in=category_ids).values_list('id', 'name'),
+        CategoryShop.objects.filter(category_id__in=category_ids)
+        .order_by('shop__name').values_list('category_id', 'shop__name'),
+    )
+
+
+def _build_categories(categories, shops):
+    """Словари в формате CategorySerializer (магазины по имени, как в Shop.Meta.ordering)"""
+    names = defaultdict(list)
+    for category_id, name in shops:
+        names[category_id].append(name)
+    return {
+        category_id: {'id': category_id, 'name': name, 'shops': names[category_id]}
+        for category_id, name in categories
+    }
+
+
+def _map_products(rows, categories):
+    # Один общий словарь категории на все ее товары
+    products = [dict(zip(PRODUCT_KEYS, row)) for row in rows]
+    for product in products:
+        product['category'] = categories[product['category']]
+    return products
+
+
+def product_rows(queryset):
+    """Данные товаров в формате ProductSerializer без ModelSerializer"""
+    rows = list(product_values(queryset))
+    categories, shops = _category_queries({row[CATEGORY_INDEX] for row in rows})
+    return _map_products(rows, _build_categories(categories, shops))
+
+
+async def aproduct_rows(queryset):
+    """Асинхронный вариант product_rows"""
+    rows = [row async for row in product_values(queryset)]
+    categories, shops = _category_queries({row[CATEGORY_INDEX] for row in rows})
+    return _map_products(rows, _build_categories(
+        [row async for row in categories],
+        [row async for row in shops],
+    ))
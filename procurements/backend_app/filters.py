@@ -0,0 +1,23 @@
+from django_filters import rest_framework as filters
+
+from .models import Product
+
+
+class ProductFilter(filters.FilterSet):
+    """Фильтры каталога: общие для списка товаров (WSGI и ASGI) и фасетов"""
+
+    class Meta:
+        model = Product
+        fields = ['category', 'user__shop__name']
+
+
+def facet_filters(filterset):
+    """Условия для ProductFacet из проверенного ProductFilter.
+
+    Поля фильтров (category, user__shop__name) есть и у ProductFacet.
+    """
+    return {
+        filterset.filters[name].field_name: value
+        for name, value in filterset.form.cleaned_data.items()
+        if value not in (None, '')
+    }
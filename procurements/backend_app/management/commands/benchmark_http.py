@@ -0,0 +1,102 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from requests import Session
+
+
+class Command(BaseCommand):
+    """Нагрузочный замер пропускной способности при N одновременных соединениях.
+
+    Запускается против двух развертываний на одной машине, например:
+        gunicorn procurements.wsgi -w 4 -b :8000
+        uvicorn procurements.asgi:application --workers 4 --port 8001
+
+        manage.py benchmark_http --base-url http://127.0.0.1:8000 --path /api/products/
+        manage.py benchmark_http --base-url http://127.0.0.1:8001 --path /api/async/products/
+    """
+    help = 'Замер RPS и задержек при разном числе одновременных соединений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', required=True)
+        parser.add_argument('--path', action='append', dest='paths', required=True,
+                            help='Путь эндпоинта, можно указать несколько раз')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200],
+                            help='Число одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Длительность одного прогона, сек')
+        parser.add_argument('--token', help='Токен для эндпоинтов с авторизацией')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f"Token {options['token']}"
+
+        self.stdout.write(
+            f"{'path':<32}{'conn':>6}{'requests':>10}{'errors':>8}"
+            f"{'rps':>10}{'p50 ms':>9}{'p99 ms':>9}"
+        )
+        for path in options['paths']:
+            url = options['base_url'].rstrip('/') + path
+            for concurrency in options['concurrency']:
+                result = self._run(url, concurrency, options['duration'],
+                                   headers, options['timeout'])
+                self.stdout.write(
+                    f"{path:<32}{concurrency:>6}{result['requests']:>10}"
+                    f"{result['errors']:>8}{result['rps']:>10.1f}"
+                    f"{result['p50']:>9.1f}{result['p99']:>9.1f}"
+                )
+
+    def _run(self, url, concurrency, duration, headers, timeout):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            nonlocal errors
+            local_latencies = []
+            local_errors = 0
+            # Отдельная сессия - отдельное keep-alive соединение на поток
+            with Session() as session:
+                session.headers.update(headers)
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        response = session.get(url, timeout=timeout)
+                        response.content
+                        if response.status_code >= 400:
+                            local_errors += 1
+                            continue
+                    except Exception:
+                        local_errors += 1
+                        continue
+                    local_latencies.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local_latencies)
+                errors += local_errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+        elapsed = time.perf_counter() - started
+
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p99': _percentile(latencies, 0.99) * 1000,
+        }
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from backend_app.fast_serializers import product_rows
+from backend_app.models import Category, Product, Shop, User
+from backend_app.renderers import FastJSONRenderer
+from backend_app.serializers import ProductSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """Микробенчмарк сериализации списка товаров.
+
+    Сравнивает ProductSerializer + JSONRenderer с быстрым путем
+    (product_rows + FastJSONRenderer) и проверяет совпадение ответов.
+    С --generate N замер идет на N сгенерированных товаров,
+    которые удаляются откатом транзакции.
+    """
+    help = 'Замер скорости сериализации товаров (строк в секунду)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', type=int, default=0,
+                            help='Сгенерировать N временных товаров')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['generate']:
+                    self._generate(options['generate'])
+                self._benchmark(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _benchmark(self, repeat):
+        queryset = Product.objects.live()
+
+        def serializer_path():
+            data = ProductSerializer(
+                queryset.select_related('category').prefetch_related('category__shops'),
+                many=True,
+            ).data
+            return JSONRenderer().render(data)
+
+        def fast_path():
+            return FastJSONRenderer().render(product_rows(queryset))
+
+        if serializer_path() != fast_path():
+            raise CommandError('Ответы ProductSerializer и быстрого пути различаются')
+
+        count = queryset.count()
+        self.stdout.write(f'Товаров: {count}, повторов: {repeat}')
+        for name, func in (('ProductSerializer', serializer_path), ('fast path', fast_path)):
+            best = min(self._measure(func) for _ in range(repeat))
+            rate = count / best if best else 0.0
+            self.stdout.write(f'{name:<20}{best * 1000:>10.1f} ms{rate:>14.0f} rows/s')
+
+    def _measure(self, func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
+
+    def _generate(self, count):
+        user = User.objects.create(username='benchmark', password='-',
+                                   email='benchmark@example.com', type='shop')
+        shop = Shop.objects.create(name='benchmark', user=user)
+        categories = [Category.objects.create(name=f'Категория {i}') for i in range(10)]
+        for category in categories:
+            category.shops.add(shop)
+        Product.objects.bulk_create([
+            Product(name=f'Товар {i}', ID_product=i, info="{'Цвет': 'черный'}",
+                    quantity=i % 50, price=1000 + i, category=categories[i % 10], user=user)
+            for i in range(count)
+        ], batch_size=1000)
@@ -0,0 +1,270 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.db.models import Sum
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend_app.models import Category, Contact, Order, OrderItem, Product, Shop, User
+from backend_app.routers import routing_scope
+from backend_app.stock import get_stock_counters, reservations_enabled
+from backend_app.views import CartView, OrderConfirmView
+
+from .benchmark_http import _percentile
+
+DEADLOCK = '40P01'
+SERIALIZATION_FAILURE = '40001'
+RETRYABLE = {DEADLOCK, SERIALIZATION_FAILURE}
+
+OPERATIONS = ('add', 'remove', 'confirm')
+
+
+def _new_stats():
+    return {'latencies': [], 'ok': 0, 'rejected': 0, 'errors': 0,
+            'deadlocks': 0, 'retries': 0, 'error_types': Counter()}
+
+
+class Command(BaseCommand):
+    """Нагрузочный стенд оформления заказов с проверкой остатков.
+
+    N потоков-покупателей одновременно добавляют в корзину, удаляют из нее
+    и подтверждают заказы по небольшому набору "горячих" товаров через
+    CartView и OrderConfirmView. В конце quantity и reserved товаров
+    сверяются с сохраненными OrderItem. Выводятся пропускная способность,
+    задержки p50/p99 (с учетом повторов), число deadlock и повторов,
+    а также классы исключений, вызвавших ошибки.
+
+    Создает и удаляет собственные тестовые данные в базе default,
+    запускать только на локальной базе.
+    """
+    help = 'Конкурентная нагрузка на корзину и подтверждение заказов с проверкой остатков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=16, help='Число потоков-покупателей')
+        parser.add_argument('--operations', type=int, default=200,
+                            help='Число операций на покупателя')
+        parser.add_argument('--products', type=int, default=3, help='Число горячих товаров')
+        parser.add_argument('--stock', type=int, default=100, help='Начальный остаток товара')
+        parser.add_argument('--max-quantity', type=int, default=3,
+                            help='Максимальное количество в одной позиции')
+        parser.add_argument('--mix', type=int, nargs=3, default=[60, 25, 15],
+                            metavar=('ADD', 'REMOVE', 'CONFIRM'), help='Доли операций')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='Повторы операции после deadlock/serialization failure')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('Внимание: стенд рассчитан на PostgreSQL, результаты блокировок будут другими')
+
+        self.random = random.Random(options['seed'])
+        self.factory = APIRequestFactory()
+        self.cart_view = CartView.as_view()
+        self.confirm_view = OrderConfirmView.as_view()
+
+        fixture = self._create_fixture(options)
+        try:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'):
+                stats, elapsed = self._run(fixture, options)
+            self._report(stats, elapsed)
+            problems = self._verify(fixture, options['stock'])
+        finally:
+            if not options['keep']:
+                self._cleanup(fixture)
+
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f'Остатки не сходятся с заказами: {len(problems)} расхождений')
+        self.stdout.write(self.style.SUCCESS('Остатки сходятся с заказами'))
+
+    # Данные
+
+    def _create_fixture(self, options):
+        tag = uuid.uuid4().hex[:8]
+        seller = User.objects.create(username=f'stress-shop-{tag}', password='-',
+                                     email=f'stress-shop-{tag}@example.com', type='shop')
+        shop = Shop.objects.create(name=f'stress-{tag}', user=seller)
+        category = Category.objects.create(name=f'stress-{tag}')
+        category.shops.add(shop)
+        products = [
+            Product.objects.create(name=f'Горячий товар {i}', ID_product=i, quantity=options['stock'],
+                                   price=100, category=category, user=seller)
+            for i in range(options['products'])
+        ]
+
+        buyers = []
+        for i in range(options['buyers']):
+            buyer = User.objects.create(username=f'stress-buyer-{tag}-{i}', password='-',
+                                        email=f'stress-buyer-{tag}-{i}@example.com')
+            contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', phone='-')
+            buyers.append((buyer, contact))
+
+        return {'seller': seller, 'shop': shop, 'category': category,
+                'products': products, 'buyers': buyers}
+
+    def _cleanup(self, fixture):
+        product_ids = [product.pk for product in fixture['products']]
+        User.objects.filter(pk__in=[buyer.pk for buyer, _ in fixture['buyers']]).delete()
+        fixture['seller'].delete()
+        fixture['category'].delete()
+        if reservations_enabled():
+            get_stock_counters().forget(product_ids)
+
+    # Нагрузка
+
+    def _run(self, fixture, options):
+        stats = defaultdict(_new_stats)
+        lock = threading.Lock()
+        start = threading.Barrier(len(fixture['buyers']) + 1)
+        product_ids = [product.pk for product in fixture['products']]
+        seeds = [self.random.random() for _ in fixture['buyers']]
+
+        def buyer_thread(buyer, contact, seed):
+            rng = random.Random(seed)
+            local = defaultdict(_new_stats)
+            # Модель User не реализует интерфейс пользователя auth,
+            # DRF проверяет только is_authenticated
+            buyer.is_authenticated = True
+            start.wait()
+            try:
+                for _ in range(options['operations']):
+                    operation = rng.choices(OPERATIONS, weights=options['mix'])[0]
+                    self._perform(operation, buyer, contact, product_ids, rng,
+                                  options, local[operation])
+            finally:
+                connection.close()
+                with lock:
+                    for operation, values in local.items():
+                        merged = stats[operation]
+                        merged['latencies'].extend(values.pop('latencies'))
+                        for key, value in values.items():
+                            merged[key] += value
+
+        threads = [
+            threading.Thread(target=buyer_thread, args=(buyer, contact, seed))
+            for (buyer, contact), seed in zip(fixture['buyers'], seeds)
+        ]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return stats, time.perf_counter() - started
+
+    def _perform(self, operation, buyer, contact, product_ids, rng, options, stats):
+        # Задержка операции включает повторы после deadlock
+        started = time.perf_counter()
+        for attempt in range(options['retries'] + 1):
+            try:
+                # Как replica_pinning_middleware для небезопасных методов
+                with routing_scope(pinned=True):
+                    response = self._request(operation, buyer, contact, product_ids, rng, options)
+            except OperationalError as e:
+                code = getattr(e.__cause__, 'pgcode', None)
+                if code == DEADLOCK:
+                    stats['deadlocks'] += 1
+                if code in RETRYABLE and attempt < options['retries']:
+                    stats['retries'] += 1
+                    continue
+                stats['errors'] += 1
+                stats['error_types'][f'OperationalError {code}' if code else 'OperationalError'] += 1
+                return
+            except Exception as e:
+                stats['errors'] += 1
+                stats['error_types'][type(e).__name__] += 1
+                return
+
+            stats['latencies'].append(time.perf_counter() - started)
+            if response.status_code < 400:
+                stats['ok'] += 1
+            elif response.status_code < 500:
+                stats['rejected'] += 1
+            else:
+                stats['errors'] += 1
+            return
+
+    def _request(self, operation, buyer, contact, product_ids, rng, options):
+        if operation == 'add':
+            request = self.factory.post('/api/cart/', {
+                'product_id': rng.choice(product_ids),
+                'quantity': rng.randint(1, options['max_quantity']),
+            }, format='json')
+            force_authenticate(request, user=buyer)
+            return self.cart_view(request)
+
+        if operation == 'remove':
+            product_id = rng.choice(product_ids)
+            request = self.factory.delete(f'/api/cart/{product_id}/')
+            force_authenticate(request, user=buyer)
+            return self.cart_view(request, product_id=product_id)
+
+        # API не позволяет указать контакт корзины, подставляем его сами
+        Order.objects.filter(user=buyer, state='basket', contact__isnull=True).update(contact=contact)
+        request = self.factory.post('/api/orders/confirm/', {}, format='json')
+        force_authenticate(request, user=buyer)
+        return self.confirm_view(request)
+
+    # Итоги
+
+    def _report(self, stats, elapsed):
+        total = sum(len(values['latencies']) for values in stats.values())
+        self.stdout.write(f'Время: {elapsed:.2f} с, операций: {total}, '
+                          f'пропускная способность: {total / elapsed if elapsed else 0:.1f} оп/с')
+        self.stdout.write(
+            f"{'operation':<10}{'ok':>8}{'rejected':>10}{'errors':>8}"
+            f"{'deadlocks':>11}{'retries':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        )
+        for operation in OPERATIONS:
+            values = stats[operation]
+            latencies = values['latencies']
+            self.stdout.write(
+                f"{operation:<10}{values['ok']:>8}{values['rejected']:>10}{values['errors']:>8}"
+                f"{values['deadlocks']:>11}{values['retries']:>9}"
+                f"{_percentile(latencies, 0.5) * 1000:>9.1f}{_percentile(latencies, 0.99) * 1000:>9.1f}"
+            )
+
+        error_types = sum((stats[operation]['error_types'] for operation in OPERATIONS), Counter())
+        if error_types:
+            self.stdout.write('Исключения: ' + ', '.join(
+                f'{name} ({count})' for name, count in error_types.most_common()
+            ))
+
+    def _verify(self, fixture, stock):
+        if reservations_enabled():
+            get_stock_counters().flush()
+
+        product_ids = [product.pk for product in fixture['products']]
+        in_baskets = defaultdict(int)
+        sold = defaultdict(int)
+        rows = OrderItem.objects.filter(product_id__in=product_ids).values(
+            'product_id', 'order__state'
+        ).annotate(total=Sum('quantity'))
+        for row in rows:
+            target = in_baskets if row['order__state'] == 'basket' else sold
+            target[row['product_id']] += row['total']
+
+        problems = []
+        for product in Product.objects.filter(pk__in=product_ids).order_by('pk'):
+            if sold[product.pk] > stock:
+                problems.append(f'{product}: продано {sold[product.pk]} при остатке {stock}')
+            if product.quantity != stock - sold[product.pk]:
+                problems.append(f'{product}: quantity={product.quantity}, '
+                                f'ожидалось {stock - sold[product.pk]}')
+            if product.reserved != in_baskets[product.pk]:
+                problems.append(f'{product}: reserved={product.reserved}, '
+                                f'в корзинах {in_baskets[product.pk]}')
+            if reservations_enabled():
+                counters = get_stock_counters()
+                available = counters.client.get(counters.available_key.format(product.pk))
+                if available is not None and int(available) != product.quantity - product.reserved:
+                    problems.append(f'{product}: счетчик Redis {int(available)}, '
+                                    f'в базе {product.quantity - product.reserved}')
+        return problems
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from backend_app.facets import refresh_facets
+from backend_app.models import Product, ProductFacet
+
+
+class Command(BaseCommand):
+    """Полный пересчет таблицы фасетов (первичное заполнение)"""
+    help = 'Пересчитать агрегаты ProductFacet для всех магазинов'
+
+    def handle(self, *args, **options):
+        user_ids = set(Product.objects.order_by().values_list('user_id', flat=True).distinct())
+        user_ids |= set(ProductFacet.objects.order_by().values_list('user_id', flat=True).distinct())
+        for user_id in user_ids:
+            refresh_facets(user_id)
+        self.stdout.write(f'Пересчитано магазинов: {len(user_ids)}')
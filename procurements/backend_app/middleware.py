@@ -0,0 +1,79 @@
+from hashlib import sha1
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+from .routers import routing_scope
+
+
+def _pin_key(request):
+    """Ключ клиента: токен авторизации или сессия"""
+    credentials = request.headers.get('Authorization') or \
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'replica-pin:' + sha1(credentials.encode()).hexdigest()
+
+
+def _pinned(key):
+    try:
+        return bool(key and cache.get(key))
+    except Exception:
+        # Кэш недоступен: читаем из основной базы, как после записи
+        return True
+
+
+async def _apinned(key):
+    try:
+        return bool(key and await cache.aget(key))
+    except Exception:
+        return True
+
+
+def _pin(key, seconds):
+    try:
+        cache.set(key, True, seconds)
+    except Exception:
+        pass
+
+
+async def _apin(key, seconds):
+    try:
+        await cache.aset(key, True, seconds)
+    except Exception:
+        pass
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    """Привязка клиента к основной базе после записи (read-your-writes).
+
+    Без DATABASE_REPLICAS ничего не делает и не обращается к кэшу.
+    """
+    if not getattr(settings, 'DATABASE_REPLICAS', []):
+        return get_response
+    pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            key = _pin_key(request)
+            pinned = request.method not in SAFE_METHODS or await _apinned(key)
+            with routing_scope(pinned) as state:
+                response = await get_response(request)
+            if key and state.wrote:
+                await _apin(key, pin_seconds)
+            return response
+    else:
+        def middleware(request):
+            key = _pin_key(request)
+            pinned = request.method not in SAFE_METHODS or _pinned(key)
+            with routing_scope(pinned) as state:
+                response = get_response(request)
+            if key and state.wrote:
+                _pin(key, pin_seconds)
+            return response
+
+    return middleware
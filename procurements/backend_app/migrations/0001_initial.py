@@ -0,0 +1,178 @@
+# Generated by Django 4.2 on 2026-10-19 15:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('staging', 'Загрузка'), ('live', 'Опубликован'), ('previous', 'Предыдущий'), ('archived', 'В архиве')], default='staging', max_length=10, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('published_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата публикации')),
+            ],
+            options={
+                'verbose_name': 'Версия каталога',
+                'verbose_name_plural': 'Версии каталога',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Название категории')),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Contact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=50, verbose_name='Город')),
+                ('street', models.CharField(max_length=100, verbose_name='Улица')),
+                ('house', models.CharField(blank=True, max_length=15, verbose_name='Дом')),
+                ('structure', models.CharField(blank=True, max_length=15, verbose_name='Корпус')),
+                ('building', models.CharField(blank=True, max_length=15, verbose_name='Строение')),
+                ('apartment', models.CharField(blank=True, max_length=15, verbose_name='Квартира')),
+                ('phone', models.CharField(max_length=20, verbose_name='Телефон')),
+            ],
+            options={
+                'verbose_name': 'Контант',
+                'verbose_name_plural': 'Контакты',
+                'ordering': ['user'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('state', models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый'), ('confirmed', 'Подтвержден'), ('assembled', 'Собран'), ('sent', 'Отправлен'), ('delivered', 'Доставлен'), ('canceled', 'Отменен')], default='new', max_length=15, verbose_name='Статус')),
+                ('contact', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='backend_app.contact', verbose_name='Контакт')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Список заказ',
+                'ordering': ('-date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=50, verbose_name='Логин')),
+                ('password', models.CharField(max_length=50, verbose_name='Пароль')),
+                ('first_name', models.CharField(blank=True, max_length=50, null=True, verbose_name='Имя')),
+                ('last_name', models.CharField(blank=True, max_length=50, null=True, verbose_name='Фамилия')),
+                ('age', models.IntegerField(blank=True, null=True, verbose_name='Возраст')),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Почта')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('type', models.CharField(choices=[('shop', 'Магазин'), ('buyer', 'Покупатель')], default='buyer', max_length=5, verbose_name='Тип пользователя')),
+            ],
+            options={
+                'verbose_name': 'Пользователь',
+                'verbose_name_plural': 'Пользователи',
+                'ordering': ['created_at', 'type'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Shop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название магазина')),
+                ('url', models.URLField(blank=True, null=True, verbose_name='Ссылка')),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='backend_app.user', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Mагазин',
+                'verbose_name_plural': 'Mагазины',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Название товара')),
+                ('ID_product', models.PositiveIntegerField(verbose_name='ID продукта')),
+                ('info', models.CharField(blank=True, max_length=1000, null=True, verbose_name='Информация')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(blank=True, null=True)),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='Зарезервировано')),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='products', to='backend_app.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='products', to='backend_app.user', verbose_name='Пользователь')),
+                ('version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='backend_app.catalogversion', verbose_name='Версия каталога')),
+            ],
+            options={
+                'verbose_name': 'Продукт',
+                'verbose_name_plural': 'Список всех товаров',
+                'ordering': ['ID_product'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('order', models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, related_name='ordered_items', to='backend_app.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(blank=True, on_delete=django.db.models.deletion.PROTECT, related_name='ordered_items', to='backend_app.product', verbose_name='продукт')),
+            ],
+            options={
+                'verbose_name': 'Заказанная позиция',
+                'verbose_name_plural': 'Список заказанных позиций',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='backend_app.user', verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='user',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, related_name='contacts', to='backend_app.user', verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='shops',
+            field=models.ManyToManyField(related_name='categories', to='backend_app.shop', verbose_name='Магазины'),
+        ),
+        migrations.AddField(
+            model_name='catalogversion',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_versions', to='backend_app.user', verbose_name='Пользователь'),
+        ),
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0, verbose_name='Количество товаров')),
+                ('in_stock_count', models.PositiveIntegerField(default=0, verbose_name='Товаров в наличии')),
+                ('min_price', models.PositiveIntegerField(blank=True, null=True, verbose_name='Минимальная цена')),
+                ('max_price', models.PositiveIntegerField(blank=True, null=True, verbose_name='Максимальная цена')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_facets', to='backend_app.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_facets', to='backend_app.user', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Фасет каталога',
+                'verbose_name_plural': 'Фасеты каталога',
+                'unique_together': {('user', 'category')},
+            },
+        ),
+    ]
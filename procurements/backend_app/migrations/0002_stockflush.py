@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-19 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.CharField(max_length=32, unique=True, verbose_name='Пачка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата записи')),
+            ],
+            options={
+                'verbose_name': 'Запись резерва',
+                'verbose_name_plural': 'Записи резерва',
+            },
+        ),
+    ]
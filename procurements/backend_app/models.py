@@ -10,6 +10,13 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+CATALOG_STATE_CHOICES = (
+    ('staging', 'Загрузка'),
+    ('live', 'Опубликован'),
+    ('previous', 'Предыдущий'),
+    ('archived', 'В архиве'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -68,6 +75,29 @@ class Category(models.Model):
     def __str__(self):
         return self.name
         
+class CatalogVersion(models.Model):
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='catalog_versions',
+                             on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус', choices=CATALOG_STATE_CHOICES, max_length=10,
+                             default='staging')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')
+    published_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = 'Версии каталога'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.user} {self.created_at} ({self.state})'
+
+
+class ProductQuerySet(models.QuerySet):
+    def live(self):
+        """Товары опубликованных версий каталога (и загруженные до версионирования)"""
+        return self.filter(models.Q(version__isnull=True) | models.Q(version__state='live'))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=50,verbose_name='Название товара')
     ID_product = models.PositiveIntegerField(verbose_name='ID продукта')
@@ -75,10 +105,15 @@ class Product(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(null=True, blank=True)
+    reserved = models.PositiveIntegerField(verbose_name='Зарезервировано', default=0)
     model = models.CharField(max_length=100, blank=True)
 
     category = models.ForeignKey(Category,verbose_name='Категория',related_name='products',on_delete=models.CASCADE)
     user = models.ForeignKey(User,verbose_name='Пользователь',related_name='products',on_delete=models.CASCADE)
+    version = models.ForeignKey(CatalogVersion, verbose_name='Версия каталога', related_name='products',
+                                blank=True, null=True, on_delete=models.CASCADE)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Продукт'        
@@ -133,11 +168,43 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, verbose_name='Заказ', related_name='ordered_items', blank=True,
                               on_delete=models.CASCADE)
 
+    # Товары с заказами не удаляются вместе с архивными версиями каталога
     product = models.ForeignKey(Product, verbose_name='продукт', related_name='ordered_items',
                                      blank=True,
-                                     on_delete=models.CASCADE)
+                                     on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
 
     class Meta:
         verbose_name = 'Заказанная позиция'
-        verbose_name_plural = "Список заказанных позиций"
\ No newline at end of file
+        verbose_name_plural = "Список заказанных позиций"
+
+class ProductFacet(models.Model):
+    """Агрегаты товаров магазина в категории для фасетов каталога"""
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='product_facets',
+                             on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='product_facets',
+                                 on_delete=models.CASCADE)
+    product_count = models.PositiveIntegerField(verbose_name='Количество товаров', default=0)
+    in_stock_count = models.PositiveIntegerField(verbose_name='Товаров в наличии', default=0)
+    min_price = models.PositiveIntegerField(verbose_name='Минимальная цена', null=True, blank=True)
+    max_price = models.PositiveIntegerField(verbose_name='Максимальная цена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Фасет каталога'
+        verbose_name_plural = 'Фасеты каталога'
+        unique_together = ('user', 'category')
+
+
+class StockFlush(models.Model):
+    """Пачка изменений резерва из Redis, уже записанная в Product.reserved.
+
+    Запись создается в одной транзакции с обновлением резерва, поэтому
+    повторно выданная Redis пачка (если очистка после записи не удалась)
+    не применяется второй раз.
+    """
+    batch = models.CharField(max_length=32, unique=True, verbose_name='Пачка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата записи')
+
+    class Meta:
+        verbose_name = 'Запись резерва'
+        verbose_name_plural = 'Записи резерва'
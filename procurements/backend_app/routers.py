@@ -0,0 +1,69 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+# Состояние текущего запроса: был ли он привязан к основной базе
+# и выполнялась ли в нем запись. Хранится изменяемым объектом, чтобы
+# отметка о записи из потока sync_to_async была видна middleware.
+_routing_state = ContextVar('replica_routing_state', default=None)
+
+
+class RoutingState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """Область маршрутизации одного запроса"""
+    state = RoutingState(pinned)
+    token = _routing_state.set(state)
+    try:
+        yield state
+    finally:
+        _routing_state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Чтение с реплик, запись в основную базу.
+
+    После записи чтения в рамках того же запроса (и в течение
+    REPLICA_PIN_SECONDS для того же клиента, см. replica_pinning_middleware)
+    идут в основную базу, чтобы не видеть устаревших данных. Реплики
+    используются только внутри routing_scope, то есть в HTTP-запросах.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+
+        state = _routing_state.get()
+        # Вне HTTP-запроса (команды, задачи Celery) читаем из основной базы:
+        # такой код обычно пишет результат чтения обратно
+        if state is None or state.pinned:
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что в ней же и пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.pinned = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,225 @@
+import time
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from redis import Redis
+
+from .models import Product, StockFlush
+
+# Резерв: атомарно проверяет и уменьшает доступный остаток,
+# а увеличение Product.reserved копит в хэше для записи в базу пачкой.
+RESERVE_SCRIPT = """
+local available = redis.call('GET', KEYS[1])
+if not available then
+    return {-1, 0}
+end
+available = tonumber(available)
+local quantity = tonumber(ARGV[2])
+if available < quantity then
+    return {0, available}
+end
+redis.call('DECRBY', KEYS[1], quantity)
+redis.call('HINCRBY', KEYS[2], ARGV[1], quantity)
+return {1, available - quantity}
+"""
+
+# Изменение доступного остатка (если счетчик есть) и отложенного резерва
+ADJUST_SCRIPT = """
+if tonumber(ARGV[2]) ~= 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[3])
+"""
+
+# Изменение доступного остатка при изменении quantity в базе.
+# Остаток не может стать отрицательным: такой товар уже зарезервирован.
+CHANGE_SCRIPT = """
+local available = redis.call('GET', KEYS[1])
+if not available then
+    return {-1, 0}
+end
+available = tonumber(available)
+local result = available + tonumber(ARGV[1])
+if result < 0 then
+    return {0, available}
+end
+redis.call('SET', KEYS[1], result)
+return {1, result}
+"""
+
+# Инициализация счетчика из базы с учетом еще не записанных изменений.
+# Пока пачка записывается, неизвестно, попала ли она в прочитанные
+# из базы значения; если между чтением базы и вызовом скрипта запись
+# пачки завершилась, значение устарело. В обоих случаях nil - повтор.
+SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return nil
+end
+if (redis.call('GET', KEYS[4]) or '') ~= ARGV[3] then
+    return nil
+end
+local pending = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or 0)
+redis.call('SET', KEYS[1], tonumber(ARGV[2]) - pending, 'NX')
+return tonumber(redis.call('GET', KEYS[1]))
+"""
+
+# Забрать накопленные изменения резерва вместе с идентификатором пачки.
+# Незавершенная пачка (упавшая запись в базу или очистка) отдается
+# повторно с тем же идентификатором.
+TAKE_BATCH_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+local batch = redis.call('GET', KEYS[3])
+if not batch then
+    batch = ARGV[1]
+    redis.call('SET', KEYS[3], batch)
+end
+return {batch, redis.call('HGETALL', KEYS[2])}
+"""
+
+
+def reservations_enabled():
+    return settings.STOCK_RESERVATION_BACKEND == 'redis'
+
+
+@lru_cache(maxsize=None)
+def get_stock_counters():
+    return StockCounters(Redis.from_url(settings.STOCK_REDIS_URL))
+
+
+class StockCounters:
+    """Доступные остатки товаров в Redis для резервирования без блокировок строк.
+
+    Доступный остаток (quantity - reserved) уменьшается атомарно на стороне
+    Redis, а изменения Product.reserved записываются в базу пачками (flush).
+    """
+    available_key = 'stock:available:{}'
+    pending_key = 'stock:pending'
+    flushing_key = 'stock:flushing'
+    batch_key = 'stock:flushing:batch'
+    generation_key = 'stock:generation'
+
+    seed_attempts = 50
+    seed_delay = 0.01
+    batch_size = 500
+    # Сколько хранить отметки о записанных пачках
+    flush_log_ttl = timedelta(days=1)
+
+    def __init__(self, client):
+        self.client = client
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._adjust = client.register_script(ADJUST_SCRIPT)
+        self._change = client.register_script(CHANGE_SCRIPT)
+        self._seed = client.register_script(SEED_SCRIPT)
+        self._take_batch = client.register_script(TAKE_BATCH_SCRIPT)
+
+    def reserve(self, product_id, quantity):
+        """Резерв товара. Возвращает (успех, доступный остаток)"""
+        keys = [self.available_key.format(product_id), self.pending_key]
+        result, available = self._reserve(keys=keys, args=[product_id, quantity])
+        if result == -1:
+            self.seed(product_id)
+            result, available = self._reserve(keys=keys, args=[product_id, quantity])
+        return result == 1, available
+
+    def release(self, product_id, quantity):
+        """Снятие резерва (удаление из корзины)"""
+        self._adjust(keys=[self.available_key.format(product_id), self.pending_key],
+                     args=[product_id, quantity, -quantity])
+
+    def commit(self, product_id, quantity):
+        """Подтверждение заказа: quantity уже уменьшено в базе,
+        резерв снимается вместе со следующей пачкой. Доступный остаток не меняется."""
+        self._adjust(keys=[self.available_key.format(product_id), self.pending_key],
+                     args=[product_id, 0, -quantity])
+
+    def change(self, product_id, delta):
+        """Изменение доступного остатка на delta (изменение quantity в базе).
+        Возвращает (успех, доступный остаток)"""
+        keys = [self.available_key.format(product_id)]
+        result, available = self._change(keys=keys, args=[delta])
+        if result == -1:
+            self.seed(product_id)
+            result, available = self._change(keys=keys, args=[delta])
+        return result == 1, available
+
+    def add_available(self, product_id, delta):
+        """Изменение доступного остатка без проверки, если счетчик уже есть.
+        Без счетчика следующий резерв прочитает остаток из базы."""
+        self._adjust(keys=[self.available_key.format(product_id), self.pending_key],
+                     args=[product_id, delta, 0])
+
+    def seed(self, product_id):
+        keys = [self.available_key.format(product_id), self.pending_key,
+                self.flushing_key, self.generation_key]
+        for _ in range(self.seed_attempts):
+            generation = self.client.get(self.generation_key) or b''
+            row = Product.objects.filter(pk=product_id).values_list('quantity', 'reserved').first()
+            available = row[0] - row[1] if row else 0
+            value = self._seed(keys=keys, args=[product_id, available, generation])
+            if value is not None:
+                return value
+            time.sleep(self.seed_delay)
+        raise RuntimeError(f'Не удалось инициализировать остаток товара {product_id}')
+
+    def reset(self, product_ids):
+        """Сброс счетчиков после изменения quantity в базе.
+        Следующий резерв заново прочитает остаток из базы."""
+        if product_ids:
+            self.client.delete(*[self.available_key.format(pk) for pk in product_ids])
+
+    def forget(self, product_ids):
+        """Удаление счетчиков и отложенного резерва удаленных товаров"""
+        if product_ids:
+            self.reset(product_ids)
+            self.client.hdel(self.pending_key, *product_ids)
+
+    def flush(self):
+        """Запись накопленных изменений резерва в Product.reserved.
+
+        Идемпотентна: пачка отмечается в StockFlush в той же транзакции,
+        и уже отмеченная пачка только удаляется из Redis.
+        """
+        taken = self._take_batch(keys=[self.pending_key, self.flushing_key, self.batch_key],
+                                 args=[uuid.uuid4().hex])
+        if not taken:
+            return 0
+        batch_id, raw = taken[0].decode(), taken[1]
+        deltas = {
+            int(raw[i]): int(raw[i + 1])
+            for i in range(0, len(raw), 2) if int(raw[i + 1])
+        }
+
+        ids = list(deltas)
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    StockFlush.objects.create(batch=batch_id)
+            except IntegrityError:
+                # Пачку уже записал предыдущий или параллельный вызов
+                ids = []
+            for start in range(0, len(ids), self.batch_size):
+                batch = ids[start:start + self.batch_size]
+                Product.objects.filter(pk__in=batch).update(
+                    reserved=F('reserved') + Case(
+                        *[When(pk=pk, then=Value(deltas[pk])) for pk in batch],
+                        default=Value(0),
+                    )
+                )
+            StockFlush.objects.filter(created_at__lt=timezone.now() - self.flush_log_ttl).delete()
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.flushing_key, self.batch_key)
+        pipe.incr(self.generation_key)
+        pipe.execute()
+        return len(ids)
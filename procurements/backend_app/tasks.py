@@ -1,4 +1,10 @@
 from celery import shared_task
 
+from .stock import get_stock_counters, reservations_enabled
 
-# @shared_task
\ No newline at end of file
+
+@shared_task(ignore_result=True)
+def flush_stock_reservations():
+    """Запись накопленных в Redis изменений резерва в Product.reserved"""
+    if reservations_enabled():
+        get_stock_counters().flush()
@@ -1,3 +1,604 @@
-from django.test import TestCase
+import json
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.db import router, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .catalog import cleanup_catalog, patch_stock, publish_catalog, rollback_catalog, stage_catalog
+from .facets import refresh_facets
+from .fast_serializers import product_rows
+from .middleware import replica_pinning_middleware
+from .models import (
+    Shop, Category, CatalogVersion, Product, ProductFacet, User, Contact, Order, OrderItem
+)
+from .renderers import FastJSONRenderer
+from .routers import routing_scope
+from .serializers import ProductSerializer
+from .stock import StockCounters
+from .views import CartView, OrderConfirmView, PartnerStockUpdate
+
+
+class ProductFastPathContractTest(TestCase):
+    """Быстрый путь каталога должен совпадать с ProductSerializer байт в байт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        first = User.objects.create(username='shop1', password='x', email='shop1@example.com', type='shop')
+        second = User.objects.create(username='shop2', password='x', email='shop2@example.com', type='shop')
+        shop_b = Shop.objects.create(name='Связной', user=first)
+        shop_a = Shop.objects.create(name='Евросеть', user=second)
+
+        phones = Category.objects.create(name='Смартфоны')
+        phones.shops.add(shop_b, shop_a)
+        empty = Category.objects.create(name='Без магазинов')
+
+        Product.objects.create(name='iPhone "15"', ID_product=3, info="{'color': 'черный'}",
+                               quantity=5, price=90000, price_rrc=95000, model='apple/iphone',
+                               category=phones, user=first)
+        Product.objects.create(name='Строка\u2028разделитель', ID_product=1, info=None,
+                               quantity=0, price=0, category=phones, user=second)
+        Product.objects.create(name='Чехол', ID_product=2, info='',
+                               quantity=10, price=500, category=empty, user=first)
+
+    def render_serializer(self, data):
+        return JSONRenderer().render(data)
+
+    def render_fast(self, data):
+        return FastJSONRenderer().render(data)
+
+    def test_list_matches_serializer(self):
+        queryset = Product.objects.live()
+        expected = self.render_serializer(ProductSerializer(queryset, many=True).data)
+        self.assertEqual(self.render_fast(product_rows(queryset)), expected)
+
+    def test_detail_matches_serializer(self):
+        for product in Product.objects.all():
+            expected = self.render_serializer(ProductSerializer(product).data)
+            rows = product_rows(Product.objects.filter(pk=product.pk))
+            self.assertEqual(self.render_fast(rows[0]), expected)
+
+    def test_empty_list(self):
+        queryset = Product.objects.none()
+        self.assertEqual(self.render_fast(product_rows(queryset)),
+                         self.render_serializer(ProductSerializer(queryset, many=True).data))
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica_1'],
+    REPLICA_PIN_SECONDS=5,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class ReplicaRouterTest(TransactionTestCase):
+    """Маршрутизация чтения на реплику и привязка к основной базе после записи.
+
+    Проверяется только выбор базы, соединение с репликой не открывается,
+    поэтому настоящая реплика не нужна. TransactionTestCase: в TestCase
+    каждый тест идет внутри транзакции, а в транзакции роутер всегда
+    выбирает основную базу.
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replica_in_request(self):
+        with routing_scope():
+            self.assertEqual(Product.objects.all().db, 'replica_1')
+
+    def test_reads_outside_request_go_to_primary(self):
+        self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_writes_go_to_primary_and_pin_request(self):
+        with routing_scope() as state:
+            self.assertEqual(router.db_for_write(Product), 'default')
+            self.assertTrue(state.wrote)
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_atomic_block_reads_primary(self):
+        with routing_scope():
+            with transaction.atomic():
+                self.assertEqual(Product.objects.all().db, 'default')
+            self.assertEqual(Product.objects.all().db, 'replica_1')
+
+    def test_unsafe_methods_are_pinned(self):
+        seen = []
+
+        def view(request):
+            seen.append(Product.objects.all().db)
+
+        replica_pinning_middleware(view)(self.factory.post('/'))
+        self.assertEqual(seen, ['default'])
+
+    def test_pinning_after_write_expires(self):
+        seen = []
+
+        def view(request):
+            if request.method == 'POST':
+                router.db_for_write(Product)
+            seen.append(Product.objects.all().db)
+
+        middleware = replica_pinning_middleware(view)
+        auth = {'HTTP_AUTHORIZATION': 'Token buyer'}
+        middleware(self.factory.post('/', **auth))
+        middleware(self.factory.get('/', **auth))
+        middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token other'))
+
+        later = time.time() + 6
+        with mock.patch('time.time', return_value=later):
+            middleware(self.factory.get('/', **auth))
+
+        self.assertEqual(seen, ['default', 'default', 'replica_1', 'replica_1'])
+
+    def test_cache_errors_pin_to_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(Product.objects.all().db)
+
+        with mock.patch('backend_app.middleware.cache') as cache:
+            cache.get.side_effect = ConnectionError
+            cache.set.side_effect = ConnectionError
+            replica_pinning_middleware(view)(self.factory.get('/', HTTP_AUTHORIZATION='Token buyer'))
+        self.assertEqual(seen, ['default'])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_disabled_without_replicas(self):
+        def view(request):
+            return request
+
+        with mock.patch('backend_app.middleware.cache') as cache:
+            self.assertIs(replica_pinning_middleware(view), view)
+        cache.get.assert_not_called()
+
+
+class ProductFilterTest(TestCase):
+    """Список товаров (WSGI и ASGI) и фасеты фильтруются одинаково"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        shop = Shop.objects.create(name='Связной', user=user)
+        cls.phones = Category.objects.create(name='Смартфоны')
+        cases = Category.objects.create(name='Чехлы')
+        for category in (cls.phones, cases):
+            category.shops.add(shop)
+        Product.objects.create(name='iPhone', ID_product=1, quantity=5, price=90000,
+                               category=cls.phones, user=user)
+        Product.objects.create(name='Чехол', ID_product=2, quantity=0, price=500,
+                               category=cases, user=user)
+        refresh_facets(user.pk)
+
+    def test_invalid_filter_is_bad_request(self):
+        for url in ('/api/products/', '/api/async/products/', '/api/products/facets/'):
+            for query in ({'category': 'abc'}, {'category': 999}):
+                response = self.client.get(url, query)
+                self.assertEqual(response.status_code, 400, (url, query))
+                self.assertIn('category', response.json())
+
+    def test_sync_and_async_lists_match(self):
+        for query in ({}, {'category': self.phones.pk}, {'user__shop__name': 'Связной'},
+                      {'user__shop__name': 'Евросеть'}):
+            sync = self.client.get('/api/products/', query)
+            async_ = self.client.get('/api/async/products/', query)
+            self.assertEqual(sync.status_code, 200)
+            self.assertEqual(sync.content, async_.content, query)
+
+    def test_facets_use_same_filters(self):
+        response = self.client.get('/api/products/facets/', {'category': self.phones.pk})
+        products = self.client.get('/api/products/', {'category': self.phones.pk}).json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['count'] for row in response.json()['categories']], [len(products)])
+
+
+class StockCountersTest(TestCase):
+    """Счетчики остатков в Redis (fakeredis с Lua через lupa)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        category = Category.objects.create(name='Смартфоны')
+        cls.product = Product.objects.create(name='iPhone', ID_product=1, quantity=10, reserved=2,
+                                             price=90000, category=category, user=cls.seller)
+
+    def setUp(self):
+        self.counters = StockCounters(fakeredis.FakeRedis())
+        self.counters.seed_delay = 0
+
+    def available(self):
+        value = self.counters.client.get(self.counters.available_key.format(self.product.pk))
+        return None if value is None else int(value)
+
+    def pending(self):
+        value = self.counters.client.hget(self.counters.pending_key, self.product.pk)
+        return int(value or 0)
+
+    def test_reserve_seeds_from_database(self):
+        self.assertEqual(self.counters.reserve(self.product.pk, 5), (True, 3))
+        self.assertEqual(self.counters.reserve(self.product.pk, 4), (False, 3))
+        self.assertEqual((self.available(), self.pending()), (3, 5))
+
+    def test_release_and_commit(self):
+        self.counters.reserve(self.product.pk, 5)
+        self.counters.release(self.product.pk, 2)
+        self.assertEqual((self.available(), self.pending()), (5, 3))
+
+        # Подтверждение: quantity уменьшено в базе, доступный остаток не меняется
+        Product.objects.filter(pk=self.product.pk).update(quantity=F('quantity') - 3)
+        self.counters.commit(self.product.pk, 3)
+        self.assertEqual((self.available(), self.pending()), (5, 0))
+
+    def test_flush_writes_reserved(self):
+        self.counters.reserve(self.product.pk, 5)
+        self.counters.release(self.product.pk, 1)
+        self.assertEqual(self.counters.flush(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 6)
+        self.assertEqual(self.pending(), 0)
+        self.assertFalse(self.counters.client.exists(self.counters.flushing_key))
+        self.assertEqual(self.counters.flush(), 0)
+
+    def test_flush_is_idempotent(self):
+        self.counters.reserve(self.product.pk, 3)
+        pipeline = mock.Mock()
+        pipeline.return_value.execute.side_effect = ConnectionError
+        with mock.patch.object(self.counters.client, 'pipeline', pipeline):
+            with self.assertRaises(ConnectionError):
+                self.counters.flush()
+
+        # Redis отдает ту же пачку повторно, в базу она уже записана
+        self.assertEqual(self.counters.flush(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 5)
+        self.assertFalse(self.counters.client.exists(self.counters.flushing_key))
+
+        self.counters.release(self.product.pk, 1)
+        self.assertEqual(self.counters.flush(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 4)
+
+    def test_seed_subtracts_pending(self):
+        self.counters.reserve(self.product.pk, 5)
+        self.counters.reset([self.product.pk])
+        self.assertEqual(self.counters.seed(self.product.pk), 3)
+
+    def test_seed_waits_for_flush(self):
+        self.counters.reserve(self.product.pk, 5)
+        self.counters.reset([self.product.pk])
+        self.counters.client.rename(self.counters.pending_key, self.counters.flushing_key)
+        self.counters.seed_attempts = 2
+        with self.assertRaises(RuntimeError):
+            self.counters.seed(self.product.pk)
+
+        # Незавершенная пачка записывается следующим flush, после чего
+        # остаток читается из базы без повторного вычитания
+        self.counters.flush()
+        self.assertEqual(self.counters.seed(self.product.pk), 3)
+
+
+@override_settings(STOCK_RESERVATION_BACKEND='redis')
+class CartCountersTest(TestCase):
+    """Корзина в режиме резервирования через Redis"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        category = Category.objects.create(name='Смартфоны')
+        cls.product = Product.objects.create(name='iPhone', ID_product=1, quantity=10,
+                                             price=90000, category=category, user=seller)
+        cls.buyer = User.objects.create(username='buyer', password='x', email='buyer@example.com')
+
+    def setUp(self):
+        self.counters = StockCounters(fakeredis.FakeRedis())
+        patcher = mock.patch('backend_app.views.get_stock_counters', return_value=self.counters)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = APIRequestFactory()
+        # Модель User не реализует интерфейс пользователя auth
+        self.buyer.is_authenticated = True
+
+    def call(self, request, **kwargs):
+        force_authenticate(request, user=self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            return CartView.as_view()(request, **kwargs)
+
+    def add(self, quantity):
+        return self.call(self.factory.post('/api/cart/', {
+            'product_id': self.product.pk, 'quantity': quantity
+        }, format='json'))
+
+    def remove(self):
+        return self.call(self.factory.delete(f'/api/cart/{self.product.pk}/'),
+                         product_id=self.product.pk)
+
+    def available(self):
+        return int(self.counters.client.get(self.counters.available_key.format(self.product.pk)))
+
+    def test_readd_reserves_difference(self):
+        for quantity, expected in ((3, 7), (5, 5), (2, 8)):
+            response = self.add(quantity)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.available(), expected)
+        self.assertEqual(OrderItem.objects.get().quantity, 2)
+
+    def test_readd_over_stock_reports_available(self):
+        self.add(4)
+        response = self.add(11)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10', response.data['error'])
+        self.assertEqual(self.available(), 6)
+        self.assertEqual(OrderItem.objects.get().quantity, 4)
+
+    def test_double_delete_releases_once(self):
+        self.add(4)
+        self.assertEqual(self.remove().status_code, 200)
+        self.assertEqual(self.remove().status_code, 404)
+        self.assertEqual(self.available(), 10)
+        self.assertEqual(int(self.counters.client.hget(self.counters.pending_key, self.product.pk)), 0)
+
+
+class PartnerStockUpdateTest(TestCase):
+    """PATCH /partner/stock/: частичное обновление остатков и цен"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        category = Category.objects.create(name='Смартфоны')
+        cls.product = Product.objects.create(name='iPhone', ID_product=7, quantity=10, reserved=4,
+                                             price=90000, price_rrc=95000, category=category,
+                                             user=cls.seller)
+
+    def setUp(self):
+        self.seller.is_authenticated = True
+
+    def patch(self, goods):
+        request = APIRequestFactory().patch('/partner/stock/', {'goods': goods}, format='json')
+        force_authenticate(request, user=self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = PartnerStockUpdate.as_view()(request)
+        self.product.refresh_from_db()
+        return response.status_code, json.loads(response.content)
+
+    def test_unknown_ids(self):
+        status_code, data = self.patch([{'ID_product': 999, 'quantity': 5}, {'ID_product': 7, 'quantity': 8}])
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['Updated'], 1)
+        self.assertEqual(data['Errors'], [{'ID_product': 999, 'Error': 'Товар не найден'}])
+        self.assertEqual(self.product.quantity, 8)
+
+    def test_below_reserved(self):
+        _, data = self.patch([{'ID_product': 7, 'quantity': 3}])
+        self.assertEqual(data['Updated'], 0)
+        self.assertEqual(data['Errors'],
+                         [{'ID_product': 7, 'Error': 'Количество меньше зарезервированного (4)'}])
+        self.assertEqual(self.product.quantity, 10)
+
+    def test_partial_fields(self):
+        _, data = self.patch([{'ID_product': 7, 'price': 80000}])
+        self.assertEqual((data['Updated'], data['Errors']), (1, []))
+        self.assertEqual((self.product.quantity, self.product.price, self.product.price_rrc),
+                         (10, 80000, 95000))
+
+    def test_invalid_items(self):
+        _, data = self.patch([{'ID_product': 7}, {'ID_product': 'x', 'price': 1},
+                              {'ID_product': 7, 'price': -1}])
+        self.assertEqual(data['Updated'], 0)
+        self.assertEqual(len(data['Errors']), 3)
+
+    @override_settings(STOCK_RESERVATION_BACKEND='redis')
+    def test_redis_counters(self):
+        counters = StockCounters(fakeredis.FakeRedis())
+        with mock.patch('backend_app.catalog.get_stock_counters', return_value=counters):
+            counters.reserve(self.product.pk, 5)
+            _, data = self.patch([{'ID_product': 7, 'quantity': 8}])
+            self.assertEqual(data['Errors'],
+                             [{'ID_product': 7, 'Error': 'Количество меньше зарезервированного (9)'}])
+            self.assertEqual(self.product.quantity, 10)
+
+            _, data = self.patch([{'ID_product': 7, 'quantity': 20}])
+            self.assertEqual((data['Updated'], data['Errors']), (1, []))
+        self.assertEqual(self.product.quantity, 20)
+        self.assertEqual(int(counters.client.get(counters.available_key.format(self.product.pk))), 11)
+
+    @override_settings(STOCK_RESERVATION_BACKEND='redis')
+    def test_redis_increase_applies_after_commit(self):
+        counters = StockCounters(fakeredis.FakeRedis())
+        key = counters.available_key.format(self.product.pk)
+        with mock.patch('backend_app.catalog.get_stock_counters', return_value=counters):
+            with self.captureOnCommitCallbacks() as callbacks:
+                patch_stock(self.seller.pk, [{'ID_product': 7, 'quantity': 15}])
+            self.assertEqual(int(counters.client.get(key)), 6)
+            for callback in callbacks:
+                callback()
+        self.assertEqual(int(counters.client.get(key)), 11)
+
+    @override_settings(STOCK_RESERVATION_BACKEND='redis')
+    def test_redis_failed_patch_restores_counters(self):
+        counters = StockCounters(fakeredis.FakeRedis())
+        key = counters.available_key.format(self.product.pk)
+        with mock.patch('backend_app.catalog.get_stock_counters', return_value=counters), \
+                mock.patch('backend_app.catalog._update_stock', side_effect=RuntimeError):
+            for quantity in (15, 6):
+                with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+                    patch_stock(self.seller.pk, [{'ID_product': 7, 'quantity': quantity}])
+                self.assertEqual(int(counters.client.get(key)), 6)
+
+
+@override_settings(STOCK_RESERVATION_BACKEND='redis')
+class PartnerStockCommitTest(TransactionTestCase):
+    """Ошибка после фиксации не откатывает счетчики уже записанного PATCH"""
+
+    def test_post_commit_error_keeps_counters(self):
+        seller = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        category = Category.objects.create(name='Смартфоны')
+        product = Product.objects.create(name='iPhone', ID_product=7, quantity=10, reserved=4,
+                                         price=90000, category=category, user=seller)
+        counters = StockCounters(fakeredis.FakeRedis())
+
+        def failing_refresh(pairs):
+            transaction.on_commit(mock.Mock(side_effect=RuntimeError))
+
+        with mock.patch('backend_app.catalog.get_stock_counters', return_value=counters), \
+                mock.patch('backend_app.catalog.refresh_product_facets_on_commit', failing_refresh):
+            with self.assertRaises(RuntimeError):
+                patch_stock(seller.pk, [{'ID_product': 7, 'quantity': 8}])
+
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 8)
+        self.assertEqual(int(counters.client.get(counters.available_key.format(product.pk))), 4)
+
+
+class OrderConfirmFacetsTest(TestCase):
+    """Подтверждение заказа меняет фасеты только для закончившихся товаров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        Shop.objects.create(name='Связной', user=seller)
+        category = Category.objects.create(name='Смартфоны')
+        cls.last = Product.objects.create(name='iPhone', ID_product=1, quantity=2, reserved=2,
+                                          price=90000, category=category, user=seller)
+        cls.many = Product.objects.create(name='Pixel', ID_product=2, quantity=10, reserved=1,
+                                          price=60000, category=category, user=seller)
+        refresh_facets(seller.pk)
+        cls.facet = ProductFacet.objects.get()
+
+        cls.buyer = User.objects.create(username='buyer', password='x', email='buyer@example.com')
+        contact = Contact.objects.create(user=cls.buyer, city='Москва', street='Тверская', phone='-')
+        order = Order.objects.create(user=cls.buyer, state='basket', contact=contact)
+        OrderItem.objects.create(order=order, product=cls.last, quantity=2)
+        OrderItem.objects.create(order=order, product=cls.many, quantity=1)
+
+    def setUp(self):
+        self.buyer.is_authenticated = True
+
+    def confirm(self):
+        request = APIRequestFactory().post('/api/orders/confirm/', {}, format='json')
+        force_authenticate(request, user=self.buyer)
+        return OrderConfirmView.as_view()(request)
+
+    def test_sold_out_product_leaves_in_stock(self):
+        self.assertEqual(self.facet.in_stock_count, 2)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.confirm()
+            self.facet.refresh_from_db()
+            self.assertEqual(self.facet.in_stock_count, 2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        self.facet.refresh_from_db()
+        self.assertEqual((self.facet.product_count, self.facet.in_stock_count), (2, 1))
+        self.last.refresh_from_db()
+        self.many.refresh_from_db()
+        self.assertEqual((self.last.quantity, self.last.reserved), (0, 0))
+        self.assertEqual((self.many.quantity, self.many.reserved), (9, 0))
+
+    def test_concurrent_refresh_is_not_subtracted_twice(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.confirm()
+        # Импорт или PATCH /partner/stock/ успел пересчитать фасеты раньше
+        refresh_facets(self.last.user_id)
+        for callback in callbacks:
+            callback()
+        self.facet.refresh_from_db()
+        self.assertEqual(self.facet.in_stock_count, 1)
+
+    def test_facet_errors_do_not_fail_confirmation(self):
+        with mock.patch('backend_app.facets.refresh_product_facets', side_effect=RuntimeError):
+            with self.assertLogs('backend_app.facets', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.confirm()
+        self.assertEqual(response.status_code, 200)
+        self.facet.refresh_from_db()
+        self.assertEqual(self.facet.in_stock_count, 2)
+
+
+class CatalogVersionBasketTest(TestCase):
+    """Публикация и откат каталога переносят корзины на товары новой версии"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create(username='shop', password='x', email='shop@example.com', type='shop')
+        Shop.objects.create(name='Связной', user=cls.seller)
+        cls.category = Category.objects.create(name='Смартфоны')
+        cls.buyer = User.objects.create(username='buyer', password='x', email='buyer@example.com')
+        cls.contact = Contact.objects.create(user=cls.buyer, city='Москва', street='Тверская', phone='-')
+
+    def setUp(self):
+        self.publish([1, 2])
+        self.order = Order.objects.create(user=self.buyer, state='basket', contact=self.contact)
+        product = Product.objects.live().get(ID_product=1)
+        OrderItem.objects.create(order=self.order, product=product, quantity=2)
+        Product.objects.filter(pk=product.pk).update(reserved=2)
+
+    def publish(self, ids):
+        goods = [{'id': i, 'name': f'Товар {i}', 'quantity': 5, 'price': 100, 'price_rrc': 120,
+                  'category': self.category.pk} for i in ids]
+        publish_catalog(stage_catalog(self.seller, goods))
+
+    def basket_product(self):
+        return OrderItem.objects.select_related('product').get(order=self.order).product
+
+    def test_publish_and_rollback_move_baskets(self):
+        old = self.basket_product()
+        self.publish([1, 3])
+        new = self.basket_product()
+        self.assertNotEqual(new.pk, old.pk)
+        self.assertEqual((new.ID_product, new.version.state, new.reserved), (1, 'live', 2))
+        old.refresh_from_db()
+        self.assertEqual(old.reserved, 0)
+
+        rollback_catalog(self.seller.pk)
+        self.assertEqual(self.basket_product().pk, old.pk)
+        self.assertEqual(self.basket_product().reserved, 2)
+
+    def test_confirm_rejects_withdrawn_product(self):
+        self.publish([2])
+        self.buyer.is_authenticated = True
+        request = APIRequestFactory().post('/api/orders/confirm/', {}, format='json')
+        force_authenticate(request, user=self.buyer)
+        response = OrderConfirmView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('больше не продается', response.data['error'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.state, 'basket')
+
+    def test_cleanup_keeps_ordered_products(self):
+        ordered = self.basket_product()
+        self.publish([2])
+        self.publish([2])
+        self.publish([2])
+
+        self.assertTrue(OrderItem.objects.filter(order=self.order, product=ordered).exists())
+        ordered.refresh_from_db()
+        self.assertEqual(ordered.version.state, 'archived')
+        self.assertEqual(list(ordered.version.products.values_list('ID_product', flat=True)), [1])
+        self.assertEqual(CatalogVersion.objects.filter(user=self.seller, state='archived').count(), 1)
+
+    def test_failed_publish_discards_staged_version(self):
+        live = list(Product.objects.live().values_list('pk', flat=True))
+        goods = [{'id': 5, 'name': 'Товар 5', 'quantity': 5, 'price': 100, 'price_rrc': 120,
+                  'category': self.category.pk}]
+        version = stage_catalog(self.seller, goods)
+        with mock.patch('backend_app.catalog.refresh_facets', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                publish_catalog(version)
+
+        self.assertFalse(CatalogVersion.objects.filter(pk=version.pk).exists())
+        self.assertFalse(Product.objects.filter(ID_product=5).exists())
+        self.assertEqual(list(Product.objects.live().values_list('pk', flat=True)), live)
+
+    def test_cleanup_drops_stale_staging(self):
+        goods = [{'id': 5, 'name': 'Товар 5', 'quantity': 5, 'price': 100, 'price_rrc': 120,
+                  'category': self.category.pk}]
+        stale = stage_catalog(self.seller, goods)
+        fresh = stage_catalog(self.seller, goods)
+        CatalogVersion.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=2))
+
+        cleanup_catalog(self.seller.pk)
+        self.assertFalse(CatalogVersion.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(fresh.products.count(), 1)
@@ -1,11 +1,12 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('api/user/login/', views.CustomAuthToken.as_view(), name='login'),
     path('api/user/register/', views.UserRegistration.as_view(), name='register'),
     
     path('api/products/', views.ProductListView.as_view(), name='product-list'),
+    path('api/products/facets/', views.ProductFacetView.as_view(), name='product-facets'),
     path('api/products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
     
     path('api/cart/', views.CartView.as_view(), name='cart'),
@@ -19,4 +20,12 @@ urlpatterns = [
     path('api/orders/<int:pk>/status/', views.OrderStatusView.as_view(), name='order-status'),
 
     path('partner/update/', views.PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/stock/', views.PartnerStockUpdate.as_view(), name='partner-stock'),
+    path('partner/rollback/', views.PartnerRollback.as_view(), name='partner-rollback'),
+
+    # Асинхронные версии read-эндпоинтов для запуска под ASGI (uvicorn)
+    path('api/async/products/', async_views.AsyncProductListView.as_view(), name='async-product-list'),
+    path('api/async/products/<int:pk>/', async_views.AsyncProductDetailView.as_view(), name='async-product-detail'),
+    path('api/async/cart/', async_views.AsyncCartView.as_view(), name='async-cart'),
+    path('api/async/orders/', async_views.AsyncOrderListView.as_view(), name='async-order-list'),
 ]
\ No newline at end of file
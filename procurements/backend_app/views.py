@@ -1,13 +1,17 @@
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from django.core.mail import send_mail
 from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
+from django.db.models import F
+from django.http import JsonResponse, Http404
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
+from django.shortcuts import get_object_or_404
+from django_filters.utils import translate_validation
 from requests import get
 from rest_framework.views import APIView
 from yaml import load as load_yaml, Loader
@@ -21,6 +25,12 @@ from .serializers import (
     UserSerializer
 )
 from .permissions import IsShopUser, IsOrderOwner
+from .catalog import stage_catalog, publish_catalog, rollback_catalog, patch_stock
+from .facets import get_facets, refresh_product_facets_on_commit
+from .filters import ProductFilter, facet_filters
+from .fast_serializers import product_rows
+from .renderers import FastJSONRenderer
+from .stock import get_stock_counters, reservations_enabled
 
 STATE_CHOICES = (
     ('basket', 'Статус корзины'),
@@ -32,6 +42,13 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+def _lock_basket(order):
+    """Блокировка корзины на время изменения ее позиций.
+    Возвращает False, если корзина уже оформлена"""
+    return Order.objects.select_for_update().filter(
+        pk=order.pk, state='basket'
+    ).values_list('pk', flat=True).first() is not None
+
 class PartnerUpdate(APIView):
     """Импорт товаров из YAML для магазинов"""
     permission_classes = [permissions.IsAuthenticated, IsShopUser]
@@ -65,26 +82,45 @@ class PartnerUpdate(APIView):
                     category.shops.add(shop)
                     category.save()
 
-                Product.objects.filter(user=request.user).delete()
-
-                for item in data['goods']:
-                    product = Product.objects.create(
-                        name=item['name'],
-                        ID_product=item['id'],
-                        price=item['price'],
-                        quantity=item['quantity'],
-                        info=str(item.get('parameters', '')),  
-                        category_id=item['category'],
-                        user=request.user,
-                        model=item.get('model', ''),
-                        price_rrc=item.get('price_rrc')
-                    )
+            # Товары загружаются в отдельную версию каталога и публикуются
+            # одним переключением - покупатели не видят частично обновленный каталог
+            version = stage_catalog(request.user, data['goods'])
+            publish_catalog(version)
 
-                return JsonResponse({'Status': True})
+            return JsonResponse({'Status': True})
 
+        except ValidationError as e:
+            return JsonResponse({'Status': False, 'Error': e.messages}, status=400)
         except Exception as e:
             return JsonResponse({'Status': False, 'Error': str(e)}, status=500)
 
+class PartnerRollback(APIView):
+    """Откат каталога магазина к предыдущей версии"""
+    permission_classes = [permissions.IsAuthenticated, IsShopUser]
+
+    def post(self, request, *args, **kwargs):
+        if rollback_catalog(request.user.id) is None:
+            return JsonResponse({'Status': False, 'Error': 'Нет предыдущей версии каталога'}, status=400)
+        return JsonResponse({'Status': True})
+
+class PartnerStockUpdate(APIView):
+    """Массовое обновление остатков и цен без повторного импорта прайса"""
+    permission_classes = [permissions.IsAuthenticated, IsShopUser]
+    max_items = 10000
+
+    def patch(self, request, *args, **kwargs):
+        goods = request.data.get('goods') if isinstance(request.data, dict) else request.data
+        if not isinstance(goods, list) or not goods:
+            return JsonResponse({'Status': False, 'Error': 'Не указаны товары'}, status=400)
+        if len(goods) > self.max_items:
+            return JsonResponse(
+                {'Status': False, 'Error': f'Не более {self.max_items} товаров за запрос'},
+                status=400
+            )
+
+        result = patch_stock(request.user.id, goods)
+        return JsonResponse({'Status': True, **result})
+
 class CustomAuthToken(ObtainAuthToken):
     """Авторизация с возвратом токена и данных пользователя"""
     def post(self, request, *args, **kwargs):
@@ -107,16 +143,39 @@ class UserRegistration(generics.CreateAPIView):
 
 class ProductListView(generics.ListAPIView):
     """Список товаров с фильтрацией"""
-    queryset = Product.objects.all()
+    queryset = Product.objects.live()
     serializer_class = ProductSerializer
-    filterset_fields = ['category', 'user__shop__name']
+    filterset_class = ProductFilter
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        # Только чтение: строки values() вместо ProductSerializer, схема та же
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(product_rows(queryset))
+
+class ProductFacetView(APIView):
+    """Фасеты каталога: количество товаров по категориям и магазинам, диапазон цен"""
     permission_classes = [permissions.AllowAny]
 
+    def get(self, request):
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.none())
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return Response(get_facets(facet_filters(filterset)))
+
 class ProductDetailView(generics.RetrieveAPIView):
     """Детальная информация о товаре"""
-    queryset = Product.objects.all()
+    queryset = Product.objects.live()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def retrieve(self, request, *args, **kwargs):
+        rows = product_rows(self.get_queryset().filter(pk=kwargs['pk']))
+        if not rows:
+            raise Http404
+        return Response(rows[0])
 
 class CartView(generics.GenericAPIView):
     """Управление корзиной"""
@@ -134,20 +193,34 @@ class CartView(generics.GenericAPIView):
         serializer = OrderItemSerializer(data=request.data)
         
         if serializer.is_valid():
-            product = serializer.validated_data['product']
+            product = get_object_or_404(Product.objects.live(), pk=serializer.validated_data['product_id'])
             quantity = serializer.validated_data['quantity']
-            
-            available = product.quantity - product.reserved
-            if available < quantity:
-                return Response(
-                    {'error': f'Доступно только {available} единиц товара'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
+
+            if reservations_enabled():
+                return self._add_with_counters(order, product, quantity)
+
             with transaction.atomic():
-                product.reserved += quantity
-                product.save()
-                
+                if not _lock_basket(order):
+                    return self._cart_changed()
+                item = OrderItem.objects.filter(order=order, product=product).first()
+                current = item.quantity if item else 0
+                delta = quantity - current
+
+                # Условный UPDATE вместо product.save(): не затирает параллельные
+                # изменения quantity (PATCH /partner/stock/) и других корзин
+                products = Product.objects.filter(pk=product.pk)
+                if delta > 0 and not products.filter(
+                    quantity__gte=F('reserved') + delta
+                ).update(reserved=F('reserved') + delta):
+                    product.refresh_from_db(fields=['quantity', 'reserved'])
+                    available = product.quantity - product.reserved + current
+                    return Response(
+                        {'error': f'Доступно только {available} единиц товара'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if delta < 0:
+                    products.update(reserved=F('reserved') + delta)
+
                 OrderItem.objects.update_or_create(
                     order=order,
                     product=product,
@@ -157,23 +230,76 @@ class CartView(generics.GenericAPIView):
             return Response({'status': 'Товар добавлен в корзину'})
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def _add_with_counters(self, order, product, quantity):
+        """Добавление в корзину с резервом в Redis, без блокировки строки товара.
+
+        Позиция перезаписывается новым количеством, поэтому резервируется
+        (или снимается) только разница с уже лежащим в корзине.
+        """
+        counters = get_stock_counters()
+        applied = 0
+        try:
+            with transaction.atomic():
+                if not _lock_basket(order):
+                    return self._cart_changed()
+                item = OrderItem.objects.filter(order=order, product=product).first()
+                current = item.quantity if item else 0
+                delta = quantity - current
+
+                if delta > 0:
+                    reserved, available = counters.reserve(product.id, delta)
+                    if not reserved:
+                        return Response(
+                            {'error': f'Доступно только {available + current} единиц товара'},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    applied = delta
+                elif delta < 0:
+                    transaction.on_commit(lambda: counters.release(product.id, -delta))
+
+                OrderItem.objects.update_or_create(
+                    order=order,
+                    product=product,
+                    defaults={'quantity': quantity}
+                )
+        except Exception:
+            if applied:
+                counters.release(product.id, applied)
+            raise
+
+        return Response({'status': 'Товар добавлен в корзину'})
     
     def delete(self, request, product_id):
         """Удаление товара из корзины"""
         order = self._get_or_create_cart()
         try:
-            item = OrderItem.objects.get(order=order, product_id=product_id)
             with transaction.atomic():
-                product = item.product
-                product.reserved -= item.quantity
-                product.save()
-                item.delete()
+                if not _lock_basket(order):
+                    return self._cart_changed()
+                item = OrderItem.objects.get(order=order, product_id=product_id)
+                # Резерв снимает только тот запрос, который действительно удалил позицию
+                deleted, _ = OrderItem.objects.filter(pk=item.pk).delete()
+                if deleted and reservations_enabled():
+                    transaction.on_commit(
+                        lambda: get_stock_counters().release(item.product_id, item.quantity)
+                    )
+                elif deleted:
+                    Product.objects.filter(pk=item.product_id).update(
+                        reserved=F('reserved') - item.quantity
+                    )
             return Response({'status': 'Товар удален из корзины'})
         except OrderItem.DoesNotExist:
             return Response(
                 {'error': 'Товар не найден в корзине'},
                 status=status.HTTP_404_NOT_FOUND
             )
+
+    def _cart_changed(self):
+        return Response(
+            {'error': 'Корзина уже оформлена, повторите запрос'},
+            status=status.HTTP_409_CONFLICT
+        )
     
     def _get_or_create_cart(self):
         return Order.objects.get_or_create(
@@ -216,18 +342,53 @@ class OrderConfirmView(generics.GenericAPIView):
         
         try:
             with transaction.atomic():
-                for item in order.ordered_items.all():
+                if not _lock_basket(order):
+                    raise ValidationError('Корзина уже оформлена')
+                changed = set()
+                confirmed = []
+                # Товары обновляются в порядке id, чтобы параллельные
+                # подтверждения не блокировали друг друга крест-накрест
+                items = order.ordered_items.select_related('product').order_by('product_id')
+                live = set(
+                    Product.objects.live().filter(ordered_items__order=order)
+                    .values_list('pk', flat=True)
+                )
+                for item in items:
                     product = item.product
-                    if product.quantity < item.quantity:
+                    # Товар могли снять с продажи новой версией каталога
+                    if product.pk not in live:
+                        raise ValidationError(
+                            f'Товар больше не продается: {product.name}'
+                        )
+                    products = Product.objects.filter(pk=product.pk, quantity__gte=item.quantity)
+                    if reservations_enabled():
+                        # reserved в базе отстает от счетчиков Redis,
+                        # поэтому снимаем резерв через них после фиксации
+                        updated = products.update(quantity=F('quantity') - item.quantity)
+                        confirmed.append((product.pk, item.quantity))
+                    else:
+                        updated = products.update(
+                            quantity=F('quantity') - item.quantity,
+                            reserved=F('reserved') - item.quantity
+                        )
+                    if not updated:
                         raise ValidationError(
                             f'Недостаточно товара: {product.name}'
                         )
-                    product.quantity -= item.quantity
-                    product.reserved -= item.quantity
-                    product.save()
+                    changed.add(product.pk)
+
+                # Наличие в фасетах меняется, только если товар закончился;
+                # категории пересчитываются после фиксации, чтобы не держать
+                # строки агрегатов до отправки письма
+                refresh_product_facets_on_commit(
+                    Product.objects.filter(pk__in=changed, quantity=0)
+                    .values_list('user_id', 'category_id')
+                )
+                if confirmed:
+                    transaction.on_commit(lambda: self._commit_counters(confirmed))
                 
                 order.state = 'new'
-                order.save()
+                order.save(update_fields=['state'])
                 self._send_confirmation_email(order)
                 
             return Response({'status': 'Заказ подтвержден'})
@@ -238,6 +399,11 @@ class OrderConfirmView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    def _commit_counters(self, items):
+        counters = get_stock_counters()
+        for product_id, quantity in items:
+            counters.commit(product_id, quantity)
+
     def _send_confirmation_email(self, order):
         subject = f'Подтверждение заказа №{order.id}'
         message = f'Ваш заказ №{order.id} успешно оформлен.\n\nСостав заказа:\n'
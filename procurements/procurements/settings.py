@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
+from urllib.parse import urlsplit
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,11 +41,13 @@ INSTALLED_APPS = [
     'backend_app',
     'rest_framework',
     'rest_framework.authtoken',
+    'django_filters',
     'drf_spectacular'
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend_app.middleware.replica_pinning_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -92,6 +96,35 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DATABASE_REPLICAS=host[:port][/name],...
+# Например, для двух локальных баз: DATABASE_REPLICAS=localhost:5432/postgres_replica
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    parts = urlsplit('//' + replica.strip())
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': parts.hostname,
+        'PORT': parts.port or DATABASES['default']['PORT'],
+        'NAME': parts.path.lstrip('/') or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['backend_app.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи клиент читает только из основной базы
+REPLICA_PIN_SECONDS = 5
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/1',
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -138,7 +171,10 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    'DEFAULT_FILTER_BACKENDS': (
+        'django_filters.rest_framework.DjangoFilterBackend',
+    ),
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -151,4 +187,16 @@ DEFAULT_FROM_EMAIL = 'noreply@yourstore.com'
 
 
 
-# CELERY_BROKER_URL = 'redis://localhost:6379'
\ No newline at end of file
+CELERY_BROKER_URL = f'{REDIS_URL}/0'
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-stock-reservations': {
+        'task': 'backend_app.tasks.flush_stock_reservations',
+        'schedule': 2.0,
+    },
+}
+
+# Резервирование остатков: 'database' (блокировка строк Product)
+# или 'redis' (атомарные счетчики с отложенной записью в базу)
+STOCK_RESERVATION_BACKEND = os.environ.get('STOCK_RESERVATION_BACKEND', 'database')
+STOCK_REDIS_URL = f'{REDIS_URL}/2'
\ No newline at end of file